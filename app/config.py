@@ -1,37 +1,78 @@
 """Configuration management for RAG service."""
-from pydantic_settings import BaseSettings
+import os
 from typing import Optional
 
+import msgspec
+from dotenv import dotenv_values
 
-class Settings(BaseSettings):
+
+class Settings(msgspec.Struct, frozen=True):
     """Application settings with environment variable support."""
     
     # Qdrant Configuration
     qdrant_host: str = "localhost"
     qdrant_port: int = 6333
+    qdrant_grpc_port: int = 6334
+    qdrant_prefer_grpc: bool = True
     collection_name: str = "rag_documents"
+    dense_quantization: bool = True
+    quantization_oversampling: float = 2.0
     
     # Embedding Configuration
     embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
-    embedding_dimension: int = 384
+    embedding_dimension: Optional[int] = None
+    embedding_cache_size: int = 4096
+    embedding_backend: str = "torch"
+    onnx_model_dir: str = "data/onnx"
+    embed_max_batch: int = 32
+    embed_max_wait_ms: float = 5.0
     
     # LLM Configuration
     llm_provider: str = "groq"
     llm_api_key: Optional[str] = None
     llm_model: str = "llama-3-8b-8192"
     ollama_base_url: str = "http://localhost:11434"
+    max_context_chars: int = 3200
     
     # Timeout Configuration (in seconds)
     llm_timeout: float = 2.0
     search_timeout: float = 0.8
+    readiness_timeout: float = 2.0
+    
+    # Sparse Vocabulary Configuration
+    vocab_path: str = "data/vocab"
+    vocab_cap: int = 262144
+    vocab_save_interval: float = 10.0
     
     # RRF Configuration
     rrf_k: int = 60
     
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
-        case_sensitive = False
+    # Ingest Batching Configuration
+    ingest_max_batch: int = 64
+    ingest_max_wait_ms: float = 10.0
+    
+    @classmethod
+    def from_env(cls, env_file: str = ".env") -> "Settings":
+        """
+        Load settings from the environment and an optional .env file.
+        
+        Variable names are matched case-insensitively; environment variables
+        take precedence over the .env file.
+        
+        Args:
+            env_file: Path to the .env file
+            
+        Returns:
+            Validated, immutable settings
+        """
+        fields = set(cls.__struct_fields__)
+        data = {}
+        for source in (dotenv_values(env_file, encoding="utf-8"), os.environ):
+            for key, value in source.items():
+                name = key.lower()
+                if name in fields and value is not None:
+                    data[name] = value
+        return msgspec.convert(data, cls, strict=False)
 
 
-settings = Settings()
+settings = Settings.from_env()
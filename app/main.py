@@ -1,23 +1,25 @@
 """FastAPI application for RAG-as-a-Service."""
+import asyncio
 import logging
 import time
 from contextlib import asynccontextmanager
-from typing import AsyncIterator
+from typing import Any, AsyncIterator, Dict, List, Optional
 
-from fastapi import FastAPI, HTTPException, status
-from fastapi.responses import StreamingResponse, JSONResponse
-import json
+from fastapi import Depends, FastAPI, HTTPException, Request, status
+from fastapi.responses import StreamingResponse, ORJSONResponse
+import orjson
 
 from app.config import settings
 from app.models import (
-    DocumentInput, SearchRequest, SearchResponse, SearchResult,
+    DocumentInput, SearchRequest, SearchResponse,
     SummaryResponse, HealthResponse, DocumentResponse, DeleteResponse
 )
 from app.services.embedding import get_embedding_service
 from app.services.qdrant_client import get_qdrant_service
-from app.services.llm_service import get_llm_service
+from app.services.llm_service import LLMService, get_llm_service, close_llm_service
 from app.services.search import get_search_service
-from app.utils.circuit_breaker import CircuitBreakerException, with_timeout
+from app.services.ingest_batcher import get_ingest_batcher
+from app.services.vocab import get_vocab
 
 # Configure logging
 logging.basicConfig(
@@ -27,40 +29,108 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# Seconds between attempts when service initialization fails at startup
+STARTUP_RETRY_DELAY = 5.0
+
+
+async def _warmup(state):
+    """Load the heavy services in worker threads, then mark the app ready."""
+    while True:
+        try:
+            # Qdrant sizes its collection from the loaded embedding model
+            embedding_service = await asyncio.to_thread(get_embedding_service)
+            await asyncio.to_thread(get_qdrant_service)
+            embedding_service.batcher.start()
+            get_ingest_batcher().start()
+            state.startup_error = None
+            state.ready.set()
+            logger.info("Services initialized successfully")
+            return
+        except Exception as e:
+            state.startup_error = str(e)
+            logger.error(f"Failed to initialize services, retrying in {STARTUP_RETRY_DELAY}s: {e}")
+            await asyncio.sleep(STARTUP_RETRY_DELAY)
+
+
+async def _persist_vocab(vocab):
+    """Save the vocabulary periodically so a crash loses little ingest state."""
+    while True:
+        await asyncio.sleep(settings.vocab_save_interval)
+        await asyncio.to_thread(vocab.save)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager."""
-    # Startup: Initialize services
+    # Startup: warm up services in the background so the server can accept
+    # connections (and report readiness via /health) while the model loads
     logger.info("Starting RAG-as-a-Service...")
-    try:
-        get_embedding_service()
-        get_qdrant_service()
-        logger.info("Services initialized successfully")
-    except Exception as e:
-        logger.error(f"Failed to initialize services: {e}")
-        raise
+    # Loaded up front so a corrupt vocabulary fails startup instead of
+    # being retried by the warm-up loop
+    vocab = await asyncio.to_thread(get_vocab)
+    persist_task = asyncio.create_task(_persist_vocab(vocab))
+    app.state.ready = asyncio.Event()
+    app.state.startup_error = None
+    warmup_task = asyncio.create_task(_warmup(app.state))
     
     yield
     
     # Shutdown
     logger.info("Shutting down RAG-as-a-Service...")
+    if not warmup_task.done():
+        warmup_task.cancel()
+    if app.state.ready.is_set():
+        await get_ingest_batcher().stop()
+        await get_embedding_service().batcher.stop()
+    await close_llm_service()
+    persist_task.cancel()
+    vocab.save()
+    vocab.close()
+
+
+async def require_ready(request: Request):
+    """Wait briefly for startup warm-up, then reject with 503 if not ready."""
+    ready: Optional[asyncio.Event] = getattr(request.app.state, "ready", None)
+    if ready is None or ready.is_set():
+        # Without the lifespan, services are initialized lazily on first use
+        return
+    
+    try:
+        async with asyncio.timeout(settings.readiness_timeout):
+            await ready.wait()
+    except TimeoutError:
+        error = request.app.state.startup_error
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Service failed to start: {error}" if error else "Service is starting up, please retry"
+        )
 
 
 app = FastAPI(
     title="RAG-as-a-Service",
     description="Retrieval-Augmented Generation service with hybrid search",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint to verify service status."""
+    ready: Optional[asyncio.Event] = getattr(app.state, "ready", None)
+    if ready is not None and not ready.is_set():
+        return HealthResponse(
+            status="degraded",
+            qdrant_connected=False,
+            embedding_model_loaded=False,
+            details={"startup": app.state.startup_error or "warming up"}
+        )
+    
     try:
         # Check Qdrant connectivity
         qdrant = get_qdrant_service()
-        qdrant_connected = qdrant.health_check()
+        qdrant_connected = await qdrant.health_check()
         
         # Check if embedding model is loaded
         embedding_service = get_embedding_service()
@@ -77,6 +147,7 @@ async def health_check():
                 "qdrant_port": settings.qdrant_port,
                 "collection": settings.collection_name,
                 "embedding_model": settings.embedding_model,
+                "embedding_cache": embedding_service.cache_info(),
                 "llm_provider": settings.llm_provider
             }
         )
@@ -88,31 +159,21 @@ async def health_check():
         )
 
 
-@app.post("/documents", response_model=DocumentResponse)
+@app.post("/documents", response_model=DocumentResponse, dependencies=[Depends(require_ready)])
 async def ingest_document(document: DocumentInput):
     """
     Ingest a document with tenant isolation.
     
     Generates both dense and sparse vectors and stores in Qdrant.
+    Concurrent requests are coalesced into batched encode and upsert calls.
     """
     try:
-        start_time = time.time()
+        start_time = time.perf_counter()
         
-        # Generate embedding
-        embedding_service = get_embedding_service()
-        dense_vector = embedding_service.encode(document.content).tolist()
-        
-        # Store in Qdrant
-        qdrant = get_qdrant_service()
-        await qdrant.insert_document(
-            tenant_id=document.tenant_id,
-            document_id=document.document_id,
-            content=document.content,
-            metadata=document.metadata,
-            dense_vector=dense_vector
-        )
+        # Queue for batched embedding and storage in Qdrant
+        await get_ingest_batcher().submit(document)
         
-        latency_ms = (time.time() - start_time) * 1000
+        latency_ms = (time.perf_counter() - start_time) * 1000
         logger.info(f"Document ingested in {latency_ms:.2f}ms")
         
         return DocumentResponse(
@@ -129,7 +190,7 @@ async def ingest_document(document: DocumentInput):
         )
 
 
-@app.post("/search", response_model=SearchResponse)
+@app.post("/search", response_model=SearchResponse, dependencies=[Depends(require_ready)])
 async def search(request: SearchRequest):
     """
     Hybrid search endpoint with parallel BM25 + Vector search.
@@ -145,21 +206,13 @@ async def search(request: SearchRequest):
             top_k=request.top_k
         )
         
-        # Convert to response model
-        search_results = [
-            SearchResult(
-                document_id=r["document_id"],
-                content=r["content"],
-                score=r["score"],
-                metadata=r.get("metadata")
-            )
-            for r in results
-        ]
-        
-        return SearchResponse(
-            results=search_results,
-            latency_ms=latency_ms
-        )
+        # The fused results already carry the SearchResult fields; returning
+        # them as-is lets response_model validate everything in one
+        # pydantic-core pass instead of constructing each model in Python
+        return {
+            "results": results,
+            "latency_ms": latency_ms
+        }
     except Exception as e:
         logger.error(f"Search failed: {e}")
         raise HTTPException(
@@ -168,16 +221,78 @@ async def search(request: SearchRequest):
         )
 
 
-@app.post("/search-with-summary")
+def _ndjson(event: dict) -> bytes:
+    """Encode one NDJSON event line."""
+    return orjson.dumps(event) + b"\n"
+
+
+async def _summary_events(
+    llm_service: Optional[LLMService],
+    query: str,
+    results: List[Dict[str, Any]],
+    search_latency_ms: float,
+    overall_start: float
+) -> AsyncIterator[bytes]:
+    """
+    Stream search results, then summary tokens as the LLM produces them.
+    
+    Yields a "results" event, "token" events, an "error" event if the
+    summary fails or times out, and a final "done" event with latencies.
+    """
+    yield _ndjson({
+        "type": "results",
+        "results": results,
+        "search_latency_ms": search_latency_ms
+    })
+    
+    llm_start = time.perf_counter()
+    if not results:
+        yield _ndjson({"type": "token", "text": "No results found for your query."})
+    else:
+        stream = llm_service.generate_summary_stream(query, results)
+        try:
+            # Circuit breaker: give up if the first token is too slow
+            async with asyncio.timeout(settings.llm_timeout):
+                first_token = await stream.__anext__()
+            yield _ndjson({"type": "token", "text": first_token})
+            async for token in stream:
+                yield _ndjson({"type": "token", "text": token})
+        except StopAsyncIteration:
+            pass
+        except TimeoutError:
+            logger.warning(f"LLM first token exceeded {settings.llm_timeout}s")
+            yield _ndjson({
+                "type": "error",
+                "message": "Summary generation timed out. Search results are still available above."
+            })
+        except Exception as e:
+            logger.error(f"LLM generation failed: {e}")
+            yield _ndjson({
+                "type": "error",
+                "message": f"Summary generation failed: {str(e)}. Search results are still available above."
+            })
+        finally:
+            await stream.aclose()
+    
+    yield _ndjson({
+        "type": "done",
+        "latency_ms": (time.perf_counter() - overall_start) * 1000,
+        "search_latency_ms": search_latency_ms,
+        "llm_latency_ms": (time.perf_counter() - llm_start) * 1000
+    })
+
+
+@app.post("/search-with-summary", dependencies=[Depends(require_ready)])
 async def search_with_summary(request: SearchRequest):
     """
     Search with LLM summarization endpoint.
     
     Target latency: < 2.5s (with streaming)
-    Uses circuit breaker with timeout for LLM calls.
+    Streams NDJSON: results first, then summary tokens as they are
+    generated. Uses a circuit breaker timeout on the first LLM token.
     """
     try:
-        overall_start = time.time()
+        overall_start = time.perf_counter()
         
         # Execute hybrid search
         search_service = get_search_service()
@@ -187,65 +302,23 @@ async def search_with_summary(request: SearchRequest):
             top_k=request.top_k
         )
         
-        if not results:
-            return JSONResponse(
-                content={
-                    "results": [],
-                    "summary": "No results found for your query.",
-                    "latency_ms": (time.time() - overall_start) * 1000,
-                    "search_latency_ms": search_latency_ms,
-                    "llm_latency_ms": 0
-                }
-            )
-        
-        # Generate summary with timeout
-        llm_start = time.time()
-        llm_service = get_llm_service()
-        
-        try:
-            summary = await with_timeout(
-                llm_service.generate_summary(request.query, results),
-                timeout=settings.llm_timeout,
-                default="Summary generation timed out. Please try again."
-            )
-        except CircuitBreakerException:
-            summary = "Summary generation timed out. Search results are still available below."
-        except Exception as e:
-            logger.error(f"LLM generation failed: {e}")
-            summary = f"Summary generation failed: {str(e)}. Search results are still available below."
-        
-        llm_latency_ms = (time.time() - llm_start) * 1000
-        total_latency_ms = (time.time() - overall_start) * 1000
-        
-        # Convert to response model
-        search_results = [
-            SearchResult(
-                document_id=r["document_id"],
-                content=r["content"],
-                score=r["score"],
-                metadata=r.get("metadata")
-            )
-            for r in results
-        ]
-        
-        return JSONResponse(
-            content={
-                "results": [r.model_dump() for r in search_results],
-                "summary": summary,
-                "latency_ms": total_latency_ms,
-                "search_latency_ms": search_latency_ms,
-                "llm_latency_ms": llm_latency_ms
-            }
-        )
+        # Resolved before the response starts, so a misconfigured LLM is
+        # reported as a 500 rather than an empty 200 stream
+        llm_service = get_llm_service() if results else None
     except Exception as e:
         logger.error(f"Search with summary failed: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Search with summary failed: {str(e)}"
         )
+    
+    return StreamingResponse(
+        _summary_events(llm_service, request.query, results, search_latency_ms, overall_start),
+        media_type="application/x-ndjson"
+    )
 
 
-@app.delete("/documents/{tenant_id}", response_model=DeleteResponse)
+@app.delete("/documents/{tenant_id}", response_model=DeleteResponse, dependencies=[Depends(require_ready)])
 async def delete_tenant_documents(tenant_id: str):
     """Delete all documents for a tenant."""
     try:
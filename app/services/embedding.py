@@ -1,47 +1,308 @@
 """Local embedding service using sentence-transformers."""
+import asyncio
+import hashlib
 import logging
-from typing import List, Union, Optional
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Union, Optional
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
 from app.config import settings
+from app.utils.batching import MicroBatcher
 
 logger = logging.getLogger(__name__)
 
 
+class OnnxEncoder:
+    """
+    Int8-quantized ONNX Runtime encoder.
+    
+    Mirrors the SentenceTransformer.encode interface (mean pooling followed
+    by L2 normalization) so it can stand in for the PyTorch model.
+    """
+    
+    max_seq_length = 256
+    
+    def __init__(self, model_name: str, model_dir: str):
+        """
+        Load the quantized model, exporting it on first use.
+        
+        Args:
+            model_name: Hugging Face model to export
+            model_dir: Directory holding the exported and quantized model
+        """
+        try:
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError(
+                "EMBEDDING_BACKEND=onnx requires optimum[onnxruntime]: "
+                "pip install 'optimum[onnxruntime]'"
+            ) from e
+        
+        model_path = os.path.join(model_dir, "model_quantized.onnx")
+        if not os.path.exists(model_path):
+            self._export(model_name, model_dir)
+        
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            model_path, options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = [i.name for i in self.session.get_inputs()]
+        self._dimension = self.session.get_outputs()[0].shape[-1]
+    
+    def get_sentence_embedding_dimension(self) -> int:
+        """Get the dimension of the pooled embeddings."""
+        return self._dimension
+    
+    @staticmethod
+    def _export(model_name: str, model_dir: str):
+        """Export the model to ONNX and apply dynamic int8 quantization."""
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        from transformers import AutoTokenizer
+        
+        logger.info(f"Exporting {model_name} to ONNX with int8 quantization")
+        model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+        model.save_pretrained(model_dir)
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(model_dir)
+        
+        quantizer = ORTQuantizer.from_pretrained(model)
+        quantizer.quantize(
+            save_dir=model_dir,
+            quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False)
+        )
+    
+    def encode(
+        self,
+        sentences: Union[str, List[str]],
+        batch_size: int = 32,
+        **kwargs
+    ) -> np.ndarray:
+        """
+        Encode one or more texts into normalized dense vectors.
+        
+        Args:
+            sentences: Input text or list of texts
+            batch_size: Number of texts per inference call
+            
+        Returns:
+            numpy array of float32 embeddings
+        """
+        texts = [sentences] if isinstance(sentences, str) else list(sentences)
+        
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            tokens = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+            inputs = {name: tokens[name].astype(np.int64) for name in self._input_names}
+            hidden = self.session.run(["last_hidden_state"], inputs)[0]
+            
+            # Mean pooling over non-padding tokens, then L2 normalization
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype(np.float32))
+        
+        if not batches:
+            return np.empty((0, self._dimension), dtype=np.float32)
+        embeddings = np.concatenate(batches)
+        return embeddings[0] if isinstance(sentences, str) else embeddings
+
+
 class EmbeddingService:
     """Local embedding service for generating dense vectors."""
     
     def __init__(self):
         """Initialize the embedding model."""
-        logger.info(f"Loading embedding model: {settings.embedding_model}")
-        self.model = SentenceTransformer(settings.embedding_model)
-        self.dimension = settings.embedding_dimension
+        self.backend = settings.embedding_backend.lower()
+        logger.info(f"Loading embedding model: {settings.embedding_model} ({self.backend})")
+        
+        if self.backend == "torch":
+            self.model = SentenceTransformer(settings.embedding_model)
+        elif self.backend == "onnx":
+            self.model = OnnxEncoder(settings.embedding_model, settings.onnx_model_dir)
+        else:
+            raise ValueError(f"Unsupported embedding backend: {self.backend}")
+        
+        # The loaded model is the source of truth; a configured dimension
+        # is only checked against it
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        if settings.embedding_dimension is not None and settings.embedding_dimension != self.dimension:
+            raise ValueError(
+                f"EMBEDDING_DIMENSION={settings.embedding_dimension} does not match "
+                f"{settings.embedding_model} output dimension {self.dimension}"
+            )
+        
+        # LRU cache of embeddings keyed by content hash
+        self._cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._cache_size = settings.embedding_cache_size
+        self._cache_lock = threading.Lock()
+        self._cache_hits = 0
+        self._cache_misses = 0
+        
+        # Async encodes run on one dedicated thread, keeping the model's
+        # per-thread allocator and kernel caches warm and the event loop free
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+        
+        # Coalesces concurrent query encodes into one batched forward pass
+        self.batcher = MicroBatcher(
+            self._encode_batch_async,
+            max_batch=settings.embed_max_batch,
+            max_wait_ms=settings.embed_max_wait_ms,
+            name="Embedding"
+        )
         logger.info(f"Embedding model loaded successfully. Dimension: {self.dimension}")
     
+    @staticmethod
+    def _cache_key(text: str) -> bytes:
+        """Hash text content into a compact cache key."""
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+    
+    def _cache_get(self, key: bytes) -> Optional[np.ndarray]:
+        """Look up a cached embedding and mark it as recently used."""
+        with self._cache_lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self._cache_hits += 1
+            return vector
+    
+    def _cache_put(self, key: bytes, vector: np.ndarray):
+        """Store a freshly encoded embedding, evicting the least recently used."""
+        vector.flags.writeable = False
+        with self._cache_lock:
+            self._cache_misses += 1
+            if self._cache_size <= 0:
+                return
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+    
+    def cache_info(self) -> Dict[str, int]:
+        """Get embedding cache hit/miss counters and current size."""
+        with self._cache_lock:
+            return {
+                "hits": self._cache_hits,
+                "misses": self._cache_misses,
+                "size": len(self._cache),
+                "max_size": self._cache_size
+            }
+    
+    def get_cached(self, text: str) -> Optional[np.ndarray]:
+        """
+        Get the cached embedding of a text without encoding it.
+        
+        Args:
+            text: Input text
+            
+        Returns:
+            The read-only cached embedding, or None if not cached
+        """
+        return self._cache_get(self._cache_key(text))
+    
     def encode(self, text: str) -> np.ndarray:
         """
         Encode a single text into a dense vector.
         
+        Repeated content is served from the cache; the returned array
+        is read-only because it may be shared between callers.
+        
         Args:
             text: Input text to encode
             
         Returns:
-            numpy array of embeddings
+            numpy float32 array of embeddings
         """
-        return self.model.encode(text, convert_to_numpy=True)
+        key = self._cache_key(text)
+        vector = self._cache_get(key)
+        if vector is None:
+            vector = self.model.encode(text, convert_to_numpy=True)
+            self._cache_put(key, vector)
+        return vector
     
     def encode_batch(self, texts: List[str]) -> np.ndarray:
         """
         Encode multiple texts into dense vectors.
         
+        Only texts missing from the cache are run through the model.
+        
+        Args:
+            texts: List of input texts to encode
+            
+        Returns:
+            numpy float32 array of embeddings
+        """
+        keys = [self._cache_key(text) for text in texts]
+        vectors = [self._cache_get(key) for key in keys]
+        
+        # Encode each distinct uncached text once
+        misses = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                misses.setdefault(keys[i], texts[i])
+        
+        if misses:
+            encoded = self.model.encode(
+                list(misses.values()), convert_to_numpy=True, show_progress_bar=False
+            )
+            fresh = dict(zip(misses.keys(), encoded))
+            for key, vector in fresh.items():
+                self._cache_put(key, vector.copy())
+            vectors = [
+                fresh[key] if vector is None else vector
+                for key, vector in zip(keys, vectors)
+            ]
+        
+        if not vectors:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        return np.stack(vectors)
+    
+    async def encode_batch_async(self, texts: List[str]) -> np.ndarray:
+        """
+        Encode multiple texts on the dedicated embedding thread.
+        
         Args:
             texts: List of input texts to encode
             
+        Returns:
+            numpy float32 array of embeddings
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.encode_batch, texts)
+    
+    async def _encode_batch_async(self, texts: List[str]) -> List[np.ndarray]:
+        """Encode a batch collected by the micro-batcher."""
+        return list(await self.encode_batch_async(texts))
+    
+    async def encode_async(self, text: str) -> np.ndarray:
+        """
+        Encode a single text, batched with other concurrent callers.
+        
+        Cached texts are answered directly, without waiting for a batch
+        window or a hop to the embedding thread.
+        
+        Args:
+            text: Input text to encode
+            
         Returns:
             numpy array of embeddings
         """
-        return self.model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
+        vector = self.get_cached(text)
+        if vector is not None:
+            return vector
+        return await self.batcher.submit(text)
     
     def get_dimension(self) -> int:
         """Get the dimension of the embedding vectors."""
@@ -50,11 +311,16 @@ class EmbeddingService:
 
 # Global instance
 _embedding_service: Optional[EmbeddingService] = None
+_embedding_service_lock = threading.Lock()
 
 
 def get_embedding_service() -> EmbeddingService:
     """Get or create the global embedding service instance."""
     global _embedding_service
     if _embedding_service is None:
-        _embedding_service = EmbeddingService()
+        with _embedding_service_lock:
+            # Checked again under the lock so concurrent first calls load
+            # the model once; once set, callers never take the lock
+            if _embedding_service is None:
+                _embedding_service = EmbeddingService()
     return _embedding_service
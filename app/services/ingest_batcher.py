@@ -0,0 +1,91 @@
+"""Micro-batching ingest queue that coalesces concurrent document inserts."""
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.models import DocumentInput
+from app.services.embedding import get_embedding_service
+from app.services.qdrant_client import get_qdrant_service
+from app.utils.batching import MicroBatcher
+
+logger = logging.getLogger(__name__)
+
+
+class IngestBatcher(MicroBatcher):
+    """
+    Coalesces concurrent document inserts into batched encode and upsert calls.
+    
+    Documents submitted while a batch is being collected share a single
+    encode_batch forward pass and a single Qdrant upsert.
+    """
+    
+    def __init__(self):
+        """Initialize batcher limits from settings."""
+        super().__init__(
+            self._flush,
+            max_batch=settings.ingest_max_batch,
+            max_wait_ms=settings.ingest_max_wait_ms,
+            name="Ingest"
+        )
+    
+    async def _flush(self, documents: List[DocumentInput]) -> List[Optional[Exception]]:
+        """
+        Encode and upsert a batch of documents.
+        
+        A document whose point cannot be built (e.g. metadata Qdrant cannot
+        store) fails on its own; the rest of the batch is still upserted.
+        
+        Args:
+            documents: Documents to ingest
+        
+        Returns:
+            None for each stored document, or the error that rejected it
+        """
+        # A document submitted twice in one batch is stored once, from its
+        # last submission, so its term statistics are recorded once
+        latest = {
+            (document.tenant_id, document.document_id): document
+            for document in documents
+        }
+        unique_documents = list(latest.values())
+        
+        embedding_service = get_embedding_service()
+        dense_vectors = await embedding_service.encode_batch_async(
+            [d.content for d in unique_documents]
+        )
+        
+        qdrant = get_qdrant_service()
+        points = []
+        errors: Dict[Tuple[str, str], Exception] = {}
+        for document, dense_vector in zip(unique_documents, dense_vectors):
+            try:
+                points.append(qdrant.build_point(
+                    tenant_id=document.tenant_id,
+                    document_id=document.document_id,
+                    content=document.content,
+                    metadata=document.metadata,
+                    dense_vector=dense_vector
+                ))
+            except Exception as e:
+                logger.error(f"Failed to build point for document {document.document_id}: {e}")
+                errors[(document.tenant_id, document.document_id)] = e
+        
+        await qdrant.insert_documents_bulk(points)
+        logger.info(f"Ingested batch of {len(points)} documents")
+        return [errors.get((d.tenant_id, d.document_id)) for d in documents]
+
+
+# Global instance
+_ingest_batcher: Optional[IngestBatcher] = None
+_ingest_batcher_lock = threading.Lock()
+
+
+def get_ingest_batcher() -> IngestBatcher:
+    """Get or create the global ingest batcher instance."""
+    global _ingest_batcher
+    if _ingest_batcher is None:
+        with _ingest_batcher_lock:
+            if _ingest_batcher is None:
+                _ingest_batcher = IngestBatcher()
+    return _ingest_batcher
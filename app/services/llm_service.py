@@ -1,5 +1,6 @@
 """LLM service with streaming support for multiple providers."""
 import logging
+import threading
 from typing import AsyncIterator, Optional, List, Dict, Any
 import httpx
 from openai import AsyncOpenAI
@@ -8,6 +9,12 @@ from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# System message shared by every summary request
+_SYSTEM_MSG = {
+    "role": "system",
+    "content": "You are a helpful assistant that summarizes search results concisely."
+}
+
 
 class LLMService:
     """LLM service with support for multiple providers."""
@@ -17,18 +24,35 @@ class LLMService:
         self.provider = settings.llm_provider.lower()
         self.model = settings.llm_model
         self.timeout = settings.llm_timeout
+        self.max_context_chars = settings.max_context_chars
+        
+        # One pooled HTTP/2 client so concurrent calls share a connection
+        # instead of paying TCP/TLS handshakes
+        self._http = httpx.AsyncClient(
+            http2=True,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_keepalive_connections=100, max_connections=200)
+        )
         
         if self.provider == "groq":
             self.client = AsyncOpenAI(
                 api_key=settings.llm_api_key,
-                base_url="https://api.groq.com/openai/v1"
+                base_url="https://api.groq.com/openai/v1",
+                timeout=self.timeout,
+                http_client=self._http
             )
         elif self.provider == "openai":
-            self.client = AsyncOpenAI(api_key=settings.llm_api_key)
+            self.client = AsyncOpenAI(
+                api_key=settings.llm_api_key,
+                timeout=self.timeout,
+                http_client=self._http
+            )
         elif self.provider == "ollama":
             self.client = AsyncOpenAI(
                 api_key="ollama",  # Ollama doesn't need real API key
-                base_url=f"{settings.ollama_base_url}/v1"
+                base_url=f"{settings.ollama_base_url}/v1",
+                timeout=self.timeout,
+                http_client=self._http
             )
         else:
             raise ValueError(f"Unsupported LLM provider: {self.provider}")
@@ -47,14 +71,18 @@ class LLMService:
             Formatted prompt string
         """
         # Limit to top 3-5 chunks for context pruning
-        top_results = search_results[:min(5, len(search_results))]
+        top_results = search_results[:5]
         
-        context_parts = []
-        for i, result in enumerate(top_results, 1):
-            content = result.get("content", "")
-            context_parts.append(f"[{i}] {content}")
+        # Split the character budget across chunks so one large document
+        # cannot blow up the prompt (and the LLM prefill time)
+        chunk_budget = self.max_context_chars // max(len(top_results), 1)
         
-        context = "\n\n".join(context_parts)
+        context = "\n\n".join(
+            [
+                f"[{i}] {result.get('content', '')[:chunk_budget]}"
+                for i, result in enumerate(top_results, 1)
+            ]
+        )
         
         prompt = f"""Based on the following search results, provide a concise summary answering the query: "{query}"
 
@@ -89,12 +117,11 @@ Summary:"""
             response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": "You are a helpful assistant that summarizes search results concisely."},
+                    _SYSTEM_MSG,
                     {"role": "user", "content": prompt}
                 ],
                 max_tokens=200,
-                temperature=0.7,
-                timeout=self.timeout
+                temperature=0.7
             )
             
             summary = response.choices[0].message.content.strip()
@@ -129,13 +156,12 @@ Summary:"""
             stream = await self.client.chat.completions.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": "You are a helpful assistant that summarizes search results concisely."},
+                    _SYSTEM_MSG,
                     {"role": "user", "content": prompt}
                 ],
                 max_tokens=200,
                 temperature=0.7,
-                stream=True,
-                timeout=self.timeout
+                stream=True
             )
             
             async for chunk in stream:
@@ -145,15 +171,30 @@ Summary:"""
         except Exception as e:
             logger.error(f"LLM streaming failed: {e}")
             raise
+    
+    async def close(self):
+        """Close the shared HTTP client."""
+        await self._http.aclose()
 
 
 # Global instance
 _llm_service: Optional[LLMService] = None
+_llm_service_lock = threading.Lock()
 
 
 def get_llm_service() -> LLMService:
     """Get or create the global LLM service instance."""
     global _llm_service
     if _llm_service is None:
-        _llm_service = LLMService()
+        with _llm_service_lock:
+            if _llm_service is None:
+                _llm_service = LLMService()
     return _llm_service
+
+
+async def close_llm_service():
+    """Close the global LLM service if it was created."""
+    global _llm_service
+    if _llm_service is not None:
+        await _llm_service.close()
+        _llm_service = None
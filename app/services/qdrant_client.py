@@ -1,30 +1,103 @@
 """Qdrant vector database client with hybrid search support."""
+import asyncio
 import logging
-import hashlib
-from typing import Dict, List, Optional, Any, Tuple
-from qdrant_client import QdrantClient
+import string
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Any, Tuple, Union
+import httpx
+import numpy as np
+import xxhash
+from qdrant_client import QdrantClient, grpc
+from qdrant_client.conversions.conversion import RestToGrpc, payload_to_grpc
 from qdrant_client.models import (
-    VectorParams, Distance, PointStruct, 
-    Filter, FieldCondition, MatchValue,
-    SparseVector, SparseVectorParams, SparseIndexParams, NamedSparseVector
+    VectorParams, Distance,
+    Filter, FieldCondition, MatchValue, FilterSelector, PayloadSchemaType,
+    SparseVector, SparseVectorParams, SparseIndexParams, NamedSparseVector,
+    NamedVector, SearchRequest, ScoredPoint, SearchParams, QuantizationSearchParams,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType
 )
-import uuid
 
 from app.config import settings
+from app.services.embedding import get_embedding_service
+from app.services.vocab import get_vocab
 
 logger = logging.getLogger(__name__)
 
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Payload fields carried by search results; the tenant is already known
+RESULT_PAYLOAD_FIELDS = ["document_id", "content", "metadata"]
+_RESULT_PAYLOAD_SELECTOR = grpc.WithPayloadSelector(
+    include=grpc.PayloadIncludeSelector(fields=RESULT_PAYLOAD_FIELDS)
+)
+
+# gRPC keepalive pings keep the idle channel warm, so a search after a
+# quiet period does not pay for reconnecting to Qdrant
+GRPC_CHANNEL_OPTIONS = {
+    "grpc.keepalive_time_ms": 30000,
+    "grpc.keepalive_timeout_ms": 10000,
+    "grpc.keepalive_permit_without_calls": 1,
+    "grpc.http2.max_pings_without_data": 0
+}
+
+# Health probe: how long a result is reused and how long a probe may take
+HEALTH_CACHE_TTL = 1.0
+HEALTH_PROBE_TIMEOUT = 0.2
+
+# Maps ASCII punctuation to spaces so tokenization is a single split
+_PUNCTUATION_TABLE = str.maketrans(string.punctuation, " " * len(string.punctuation))
+
+
+def _tokenize(text: str) -> List[str]:
+    """Split text into lowercase terms, dropping punctuation."""
+    return text.lower().translate(_PUNCTUATION_TABLE).split()
+
+
+class DocumentPoint(NamedTuple):
+    """A point ready to upsert, with the term statistics to record once stored."""
+    point: grpc.PointStruct
+    tenant_id: str
+    point_id: int
+    term_ids: List[int]
+    length: int
+
 
 class QdrantService:
     """Qdrant client for hybrid vector search."""
     
     def __init__(self):
         """Initialize Qdrant client and create collection if needed."""
+        # gRPC transport multiplexes concurrent searches over one long-lived
+        # HTTP/2 channel; blocking calls are run in worker threads so the
+        # event loop stays free while waiting on Qdrant
         self.client = QdrantClient(
             host=settings.qdrant_host,
-            port=settings.qdrant_port
+            port=settings.qdrant_port,
+            grpc_port=settings.qdrant_grpc_port,
+            prefer_grpc=settings.qdrant_prefer_grpc,
+            grpc_options=GRPC_CHANNEL_OPTIONS
         )
         self.collection_name = settings.collection_name
+        self.prefer_grpc = settings.qdrant_prefer_grpc
+        # Search the in-RAM int8 copy of the dense vectors, oversampling
+        # candidates and rescoring them with the original vectors
+        self._dense_search_params = SearchParams(
+            quantization=QuantizationSearchParams(
+                ignore=False,
+                rescore=True,
+                oversampling=settings.quantization_oversampling
+            )
+        )
+        self._dense_search_params_grpc = RestToGrpc.convert_search_params(self._dense_search_params)
+        self.vocab = get_vocab()
+        self._readyz_url = f"http://{settings.qdrant_host}:{settings.qdrant_port}/readyz"
+        # Persistent client so health probes reuse a keep-alive connection
+        self._http = httpx.Client(timeout=HEALTH_PROBE_TIMEOUT)
+        self._health_cache: Tuple[float, bool] = (0.0, False)
         self._ensure_collection()
     
     def _ensure_collection(self):
@@ -38,7 +111,7 @@ class QdrantService:
                 collection_name=self.collection_name,
                 vectors_config={
                     "dense": VectorParams(
-                        size=settings.embedding_dimension,
+                        size=get_embedding_service().get_dimension(),
                         distance=Distance.COSINE
                     )
                 },
@@ -46,105 +119,254 @@ class QdrantService:
                     "sparse": SparseVectorParams(
                         index=SparseIndexParams()
                     )
-                }
+                },
+                quantization_config=ScalarQuantization(
+                    scalar=ScalarQuantizationConfig(
+                        type=ScalarType.INT8,
+                        quantile=0.99,
+                        always_ram=True
+                    )
+                ) if settings.dense_quantization else None
+            )
+            # Index tenant_id so tenant filters, counts and deletes avoid full scans
+            self.client.create_payload_index(
+                collection_name=self.collection_name,
+                field_name="tenant_id",
+                field_schema=PayloadSchemaType.KEYWORD
             )
             logger.info(f"Collection '{self.collection_name}' created successfully")
         else:
             logger.info(f"Collection '{self.collection_name}' already exists")
     
-    def _create_sparse_vector(self, text: str) -> SparseVector:
+    def _create_sparse_vector(self, tenant_id: str, text: str) -> Tuple[SparseVector, int]:
         """
-        Create a simple sparse vector from text (BM25-like).
-        Uses word frequency as a simple sparse representation.
+        Create a BM25 document sparse vector.
+        
+        Holds the saturated term-frequency part of BM25; the IDF part is
+        applied to the query vector, so the dot product is the BM25 score.
+        The document length is returned alongside so its term statistics
+        can be recorded once the point is stored.
         """
-        words = text.lower().split()
-        word_freq: Dict[str, int] = {}
-        for word in words:
-            word_freq[word] = word_freq.get(word, 0) + 1
+        term_counts = Counter(_tokenize(text))
+        doc_length = sum(term_counts.values())
+        
+        indices = [self.vocab.id_for(word) for word in term_counts]
+        if not indices:
+            return SparseVector(indices=[], values=[]), doc_length
+        
+        tf = np.fromiter(term_counts.values(), dtype=np.float32, count=len(term_counts))
+        # A tenant's first documents are normalised against their own length;
+        # the weights are stored with the point, so a placeholder average
+        # would penalise them permanently
+        avgdl = self.vocab.avgdl(tenant_id, default=doc_length)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_length / avgdl)
+        values = tf * (BM25_K1 + 1) / (tf + norm)
+        
+        return self._merge_duplicate_indices(indices, values), doc_length
+    
+    def _create_query_sparse_vector(self, tenant_id: str, text: str) -> SparseVector:
+        """
+        Create a BM25 query sparse vector weighted by the tenant's IDF.
+        
+        Terms that were never indexed are dropped since they cannot match.
+        """
+        term_counts = Counter(_tokenize(text))
         
-        # Create sparse vector using deterministic hash of words as indices
         indices = []
-        values = []
-        for word, freq in word_freq.items():
-            # Use MD5 hash for deterministic, consistent indices across runs
-            hash_obj = hashlib.md5(word.encode('utf-8'))
-            idx = int(hash_obj.hexdigest()[:8], 16) % 10000  # Limit index space
-            indices.append(idx)
-            values.append(float(freq))
-        
-        return SparseVector(indices=indices, values=values)
+        counts = []
+        for word, count in term_counts.items():
+            term_id = self.vocab.lookup(word)
+            if term_id is not None:
+                indices.append(term_id)
+                counts.append(count)
+        if not indices:
+            return SparseVector(indices=[], values=[])
+        
+        values = np.asarray(counts, dtype=np.float32) * self.vocab.idf(tenant_id, indices)
+        
+        return self._merge_duplicate_indices(indices, values)
     
-    async def insert_document(
+    @staticmethod
+    def _merge_duplicate_indices(indices: List[int], values: np.ndarray) -> SparseVector:
+        """Sum values of terms sharing an id once the vocabulary is full."""
+        unique_indices, inverse = np.unique(indices, return_inverse=True)
+        values = np.bincount(inverse, weights=values)
+        
+        return SparseVector(indices=unique_indices.tolist(), values=values.tolist())
+    
+    @staticmethod
+    def _point_id(tenant_id: str, document_id: str) -> int:
+        """
+        Derive a deterministic 64-bit point id from tenant and document ids.
+        
+        Re-ingesting a document overwrites its point instead of adding a
+        duplicate.
+        """
+        return xxhash.xxh3_64_intdigest(f"{tenant_id}\x00{document_id}".encode("utf-8"))
+    
+    def build_point(
         self,
         tenant_id: str,
         document_id: str,
         content: str,
         metadata: Dict[str, Any],
-        dense_vector: List[float]
-    ):
+        dense_vector: np.ndarray
+    ) -> DocumentPoint:
         """
-        Insert a document with dense and sparse vectors.
+        Build a point with dense and sparse vectors for a document.
+        
+        The point is built directly as a gRPC message, skipping validation
+        of the REST model and its conversion to protobuf before upsert.
+        Nothing is recorded in the vocabulary statistics until the point
+        is upserted.
         
         Args:
             tenant_id: Tenant identifier for isolation
             document_id: Unique document identifier
             content: Document content
             metadata: Additional metadata
-            dense_vector: Dense embedding vector
+            dense_vector: Dense float32 embedding vector
+            
+        Returns:
+            Point ready to be upserted, with its term statistics
+            
+        Raises:
+            ValueError: If the metadata cannot be stored as a Qdrant payload
         """
-        sparse_vector = self._create_sparse_vector(content)
-        
-        point = PointStruct(
-            id=str(uuid.uuid4()),
-            vector={
-                "dense": dense_vector,
-                "sparse": sparse_vector
-            },
-            payload={
+        sparse_vector, doc_length = self._create_sparse_vector(tenant_id, content)
+        point_id = self._point_id(tenant_id, document_id)
+        
+        point = grpc.PointStruct(
+            id=grpc.PointId(num=point_id),
+            vectors=grpc.Vectors(
+                vectors=grpc.NamedVectors(
+                    vectors={
+                        # tolist() is the fastest way to fill a repeated float field
+                        "dense": grpc.Vector(data=dense_vector.tolist()),
+                        "sparse": grpc.Vector(
+                            data=sparse_vector.values,
+                            indices=grpc.SparseIndices(data=sparse_vector.indices)
+                        )
+                    }
+                )
+            ),
+            payload=payload_to_grpc({
                 "tenant_id": tenant_id,
                 "document_id": document_id,
                 "content": content,
                 "metadata": metadata
-            }
+            })
         )
+        # The merged sparse vector holds each distinct term id once
+        return DocumentPoint(point, tenant_id, point_id, sparse_vector.indices, doc_length)
+    
+    async def insert_document(
+        self,
+        tenant_id: str,
+        document_id: str,
+        content: str,
+        metadata: Dict[str, Any],
+        dense_vector: np.ndarray
+    ):
+        """
+        Insert a document with dense and sparse vectors.
+        
+        Args:
+            tenant_id: Tenant identifier for isolation
+            document_id: Unique document identifier
+            content: Document content
+            metadata: Additional metadata
+            dense_vector: Dense float32 embedding vector
+        """
+        point = self.build_point(tenant_id, document_id, content, metadata, dense_vector)
+        await self.insert_documents_bulk([point])
+        logger.info(f"Inserted document {document_id} for tenant {tenant_id}")
+    
+    async def insert_documents_bulk(self, points: List[DocumentPoint]):
+        """
+        Insert many points with a single upsert call.
         
+        Term statistics are recorded only after the upsert succeeds, so a
+        failed write does not skew BM25 IDF and average document length.
+        
+        Args:
+            points: Points built with build_point
+        """
+        if not points:
+            return
+        
+        await asyncio.to_thread(self._upsert_and_record, points)
+    
+    def _upsert_and_record(self, points: List[DocumentPoint]):
+        """Upsert points, then record their term statistics (blocking)."""
         self.client.upsert(
             collection_name=self.collection_name,
-            points=[point]
+            points=[document_point.point for document_point in points]
+        )
+        self.vocab.add_documents(
+            (document_point.tenant_id, document_point.point_id,
+             document_point.term_ids, document_point.length)
+            for document_point in points
         )
-        logger.info(f"Inserted document {document_id} for tenant {tenant_id}")
     
-    async def search_dense(
+    @staticmethod
+    def _tenant_filter(tenant_id: str) -> Filter:
+        """Build the filter restricting a search to one tenant."""
+        return Filter(
+            must=[
+                FieldCondition(
+                    key="tenant_id",
+                    match=MatchValue(value=tenant_id)
+                )
+            ]
+        )
+    
+    def _dense_search_request(
         self,
         tenant_id: str,
-        query_vector: List[float],
-        top_k: int = 5
-    ) -> List[Dict[str, Any]]:
+        query_vector: np.ndarray,
+        top_k: int
+    ) -> Union[grpc.SearchPoints, SearchRequest]:
         """
-        Search using dense vectors.
+        Build a dense search request for the configured transport.
         
-        Args:
-            tenant_id: Tenant identifier
-            query_vector: Query embedding vector
-            top_k: Number of results to return
-            
-        Returns:
-            List of search results
+        Over gRPC the request is built directly as a protobuf message, like
+        build_point, skipping validation of the vector into a REST model and
+        its conversion to protobuf.
         """
-        results = self.client.search(
+        # tolist() is the fastest way to fill a repeated float field
+        vector = query_vector.tolist()
+        if not self.prefer_grpc:
+            return SearchRequest(
+                vector=NamedVector(name="dense", vector=vector),
+                filter=self._tenant_filter(tenant_id),
+                params=self._dense_search_params,
+                limit=top_k,
+                with_payload=RESULT_PAYLOAD_FIELDS
+            )
+        
+        return grpc.SearchPoints(
             collection_name=self.collection_name,
-            query_vector=("dense", query_vector),
-            query_filter=Filter(
+            vector=vector,
+            vector_name="dense",
+            filter=grpc.Filter(
                 must=[
-                    FieldCondition(
-                        key="tenant_id",
-                        match=MatchValue(value=tenant_id)
+                    grpc.Condition(
+                        field=grpc.FieldCondition(
+                            key="tenant_id",
+                            match=grpc.Match(keyword=tenant_id)
+                        )
                     )
                 ]
             ),
-            limit=top_k
+            params=self._dense_search_params_grpc,
+            limit=top_k,
+            with_payload=_RESULT_PAYLOAD_SELECTOR
         )
-        
+    
+    @staticmethod
+    def _to_results(hits: List[ScoredPoint]) -> List[Dict[str, Any]]:
+        """Convert scored points into search result dicts."""
         return [
             {
                 "document_id": hit.payload.get("document_id"),
@@ -152,9 +374,34 @@ class QdrantService:
                 "score": hit.score,
                 "metadata": hit.payload.get("metadata", {})
             }
-            for hit in results
+            for hit in hits
         ]
     
+    async def search_dense(
+        self,
+        tenant_id: str,
+        query_vector: np.ndarray,
+        top_k: int = 5
+    ) -> List[Dict[str, Any]]:
+        """
+        Search using dense vectors.
+        
+        Args:
+            tenant_id: Tenant identifier
+            query_vector: Query float32 embedding vector
+            top_k: Number of results to return
+            
+        Returns:
+            List of search results
+        """
+        batches = await asyncio.to_thread(
+            self.client.search_batch,
+            collection_name=self.collection_name,
+            requests=[self._dense_search_request(tenant_id, query_vector, top_k)]
+        )
+        
+        return self._to_results(batches[0])
+    
     async def search_sparse(
         self,
         tenant_id: str,
@@ -172,34 +419,65 @@ class QdrantService:
         Returns:
             List of search results
         """
-        sparse_vector = self._create_sparse_vector(query_text)
+        sparse_vector = self._create_query_sparse_vector(tenant_id, query_text)
+        if not sparse_vector.indices:
+            return []
         
-        results = self.client.search(
+        results = await asyncio.to_thread(
+            self.client.search,
             collection_name=self.collection_name,
             query_vector=NamedSparseVector(
                 name="sparse",
                 vector=sparse_vector
             ),
-            query_filter=Filter(
-                must=[
-                    FieldCondition(
-                        key="tenant_id",
-                        match=MatchValue(value=tenant_id)
-                    )
-                ]
-            ),
-            limit=top_k
+            query_filter=self._tenant_filter(tenant_id),
+            limit=top_k,
+            with_payload=RESULT_PAYLOAD_FIELDS
         )
         
-        return [
-            {
-                "document_id": hit.payload.get("document_id"),
-                "content": hit.payload.get("content"),
-                "score": hit.score,
-                "metadata": hit.payload.get("metadata", {})
-            }
-            for hit in results
-        ]
+        return self._to_results(results)
+    
+    async def search_batch(
+        self,
+        tenant_id: str,
+        query_vector: np.ndarray,
+        query_text: str,
+        top_k: int = 5
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Run the dense and sparse searches in a single batched request.
+        
+        Args:
+            tenant_id: Tenant identifier
+            query_vector: Query float32 embedding vector
+            query_text: Query text
+            top_k: Number of results to return per search
+            
+        Returns:
+            Tuple of (dense results, sparse results)
+        """
+        requests = [self._dense_search_request(tenant_id, query_vector, top_k)]
+        
+        sparse_vector = self._create_query_sparse_vector(tenant_id, query_text)
+        if sparse_vector.indices:
+            requests.append(
+                SearchRequest(
+                    vector=NamedSparseVector(name="sparse", vector=sparse_vector),
+                    filter=self._tenant_filter(tenant_id),
+                    limit=top_k,
+                    with_payload=RESULT_PAYLOAD_FIELDS
+                )
+            )
+        
+        batches = await asyncio.to_thread(
+            self.client.search_batch,
+            collection_name=self.collection_name,
+            requests=requests
+        )
+        
+        dense_results = self._to_results(batches[0])
+        sparse_results = self._to_results(batches[1]) if len(batches) > 1 else []
+        return dense_results, sparse_results
     
     async def delete_by_tenant(self, tenant_id: str) -> int:
         """
@@ -211,60 +489,63 @@ class QdrantService:
         Returns:
             Number of documents deleted
         """
-        # Scroll through all points for the tenant and delete
-        offset = None
-        deleted_count = 0
+        tenant_filter = self._tenant_filter(tenant_id)
         
-        while True:
-            results, offset = self.client.scroll(
-                collection_name=self.collection_name,
-                scroll_filter=Filter(
-                    must=[
-                        FieldCondition(
-                            key="tenant_id",
-                            match=MatchValue(value=tenant_id)
-                        )
-                    ]
-                ),
-                limit=100,
-                offset=offset,
-                with_payload=False,
-                with_vectors=False
-            )
-            
-            if not results:
-                break
-            
-            point_ids = [point.id for point in results]
-            self.client.delete(
+        # Count first, then let the server delete by filter in a single call
+        count_result = await asyncio.to_thread(
+            self.client.count,
+            collection_name=self.collection_name,
+            count_filter=tenant_filter,
+            exact=True
+        )
+        deleted_count = count_result.count
+        
+        if deleted_count:
+            await asyncio.to_thread(
+                self.client.delete,
                 collection_name=self.collection_name,
-                points_selector=point_ids
+                points_selector=FilterSelector(filter=tenant_filter),
+                wait=True
             )
-            deleted_count += len(point_ids)
-            
-            if offset is None:
-                break
         
+        await asyncio.to_thread(self.vocab.remove_tenant, tenant_id)
         logger.info(f"Deleted {deleted_count} documents for tenant {tenant_id}")
         return deleted_count
     
-    def health_check(self) -> bool:
-        """Check if Qdrant is accessible."""
+    async def health_check(self) -> bool:
+        """
+        Check if Qdrant is ready to serve requests.
+        
+        Probes Qdrant's lightweight /readyz endpoint and reuses the result
+        for HEALTH_CACHE_TTL seconds, so frequent polling rarely hits Qdrant.
+        """
+        checked_at, healthy = self._health_cache
+        if time.monotonic() - checked_at < HEALTH_CACHE_TTL:
+            return healthy
+        
         try:
-            self.client.get_collections()
-            return True
+            response = await asyncio.to_thread(self._http.get, self._readyz_url)
+            healthy = response.status_code == 200
+            if not healthy:
+                logger.error(f"Qdrant health check failed: HTTP {response.status_code}")
         except Exception as e:
             logger.error(f"Qdrant health check failed: {e}")
-            return False
+            healthy = False
+        
+        self._health_cache = (time.monotonic(), healthy)
+        return healthy
 
 
 # Global instance
 _qdrant_service: Optional[QdrantService] = None
+_qdrant_service_lock = threading.Lock()
 
 
 def get_qdrant_service() -> QdrantService:
     """Get or create the global Qdrant service instance."""
     global _qdrant_service
     if _qdrant_service is None:
-        _qdrant_service = QdrantService()
+        with _qdrant_service_lock:
+            if _qdrant_service is None:
+                _qdrant_service = QdrantService()
     return _qdrant_service
@@ -3,6 +3,7 @@ import logging
 import asyncio
 from typing import List, Dict, Any, Optional
 import time
+import threading
 
 from app.services.qdrant_client import get_qdrant_service
 from app.services.embedding import get_embedding_service
@@ -12,6 +13,13 @@ from app.config import settings
 logger = logging.getLogger(__name__)
 
 
+def _finished_result(task: asyncio.Task) -> List[Dict[str, Any]]:
+    """Get the results of a search task that completed, or an empty list."""
+    if task.done() and not task.cancelled() and task.exception() is None:
+        return task.result()
+    return []
+
+
 class SearchService:
     """Hybrid search service combining dense and sparse retrieval."""
     
@@ -19,6 +27,53 @@ class SearchService:
         """Initialize search service with required components."""
         self.qdrant = get_qdrant_service()
         self.embedder = get_embedding_service()
+        # Settings are immutable, so bind the per-search values once
+        self._rrf_k = settings.rrf_k
+        self._timeout = settings.search_timeout
+    
+    async def _search_pipelined(
+        self,
+        tenant_id: str,
+        query: str,
+        limit: int
+    ) -> tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Run the sparse search while the query is encoded, then the dense search.
+        
+        Args:
+            tenant_id: Tenant identifier
+            query: Search query
+            limit: Number of results to fetch per search
+            
+        Returns:
+            Tuple of (dense results, sparse results)
+        """
+        # Sparse search does not need the embedding, so it runs while the
+        # query is encoded off the event loop
+        sparse_task = asyncio.create_task(
+            self.qdrant.search_sparse(tenant_id, query, limit)
+        )
+        try:
+            # Generate query embedding, batched with concurrent searches
+            query_embedding = await self.embedder.encode_async(query)
+        except BaseException:
+            sparse_task.cancel()
+            raise
+        
+        dense_task = asyncio.create_task(
+            self.qdrant.search_dense(tenant_id, query_embedding, limit)
+        )
+        
+        try:
+            async with asyncio.timeout(self._timeout):
+                dense_results, sparse_results = await asyncio.gather(dense_task, sparse_task)
+        except TimeoutError:
+            logger.warning("Search timeout exceeded: %ss", self._timeout)
+            # Return partial results from whichever search finished in time
+            dense_results = _finished_result(dense_task)
+            sparse_results = _finished_result(sparse_task)
+        
+        return dense_results, sparse_results
     
     async def hybrid_search(
         self,
@@ -37,48 +92,51 @@ class SearchService:
         Returns:
             Tuple of (merged results, latency in ms)
         """
-        start_time = time.time()
-        
-        # Generate query embedding
-        query_embedding = self.embedder.encode(query).tolist()
-        
-        # Execute dense and sparse searches in parallel
-        dense_task = self.qdrant.search_dense(tenant_id, query_embedding, top_k * 2)
-        sparse_task = self.qdrant.search_sparse(tenant_id, query, top_k * 2)
+        start_time = time.perf_counter()
+        limit = top_k * 2
         
-        try:
-            dense_results, sparse_results = await asyncio.wait_for(
-                asyncio.gather(dense_task, sparse_task),
-                timeout=settings.search_timeout
+        cached_embedding = self.embedder.get_cached(query)
+        if cached_embedding is not None:
+            # No encoding to overlap with, so both searches share one request
+            try:
+                async with asyncio.timeout(self._timeout):
+                    dense_results, sparse_results = await self.qdrant.search_batch(
+                        tenant_id, cached_embedding, query, limit
+                    )
+            except TimeoutError:
+                logger.warning("Search timeout exceeded: %ss", self._timeout)
+                dense_results, sparse_results = [], []
+        else:
+            dense_results, sparse_results = await self._search_pipelined(
+                tenant_id, query, limit
             )
-        except asyncio.TimeoutError:
-            logger.warning(f"Search timeout exceeded: {settings.search_timeout}s")
-            # Return partial results if available
-            dense_results = await dense_task
-            sparse_results = []
         
         # Merge results using Reciprocal Rank Fusion
-        merged_results = reciprocal_rank_fusion(
+        final_results = reciprocal_rank_fusion(
             [dense_results, sparse_results],
-            k=settings.rrf_k
+            k=self._rrf_k,
+            limit=top_k
         )
         
-        # Return top_k results
-        final_results = merged_results[:top_k]
-        
-        latency_ms = (time.time() - start_time) * 1000
-        logger.info(f"Hybrid search completed in {latency_ms:.2f}ms, found {len(final_results)} results")
+        latency_ms = (time.perf_counter() - start_time) * 1000
+        logger.info(
+            "Hybrid search completed in %.2fms, found %d results",
+            latency_ms, len(final_results)
+        )
         
         return final_results, latency_ms
 
 
 # Global instance
 _search_service: Optional[SearchService] = None
+_search_service_lock = threading.Lock()
 
 
 def get_search_service() -> SearchService:
     """Get or create the global search service instance."""
     global _search_service
     if _search_service is None:
-        _search_service = SearchService()
+        with _search_service_lock:
+            if _search_service is None:
+                _search_service = SearchService()
     return _search_service
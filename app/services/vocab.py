@@ -0,0 +1,341 @@
+"""Persistent vocabulary and per-tenant term statistics for BM25 sparse vectors."""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import xxhash
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _write_json_atomic(path: str, data) -> None:
+    """Write JSON to a temporary file and atomically move it into place."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _sqlite_id(point_id: int) -> int:
+    """Map an unsigned 64-bit point id onto SQLite's signed INTEGER range."""
+    return point_id - (1 << 64) if point_id >= (1 << 63) else point_id
+
+
+class Vocab:
+    """
+    Thread-safe mapping of terms to stable integer ids.
+    
+    Also tracks per-tenant document frequencies and document lengths,
+    which provide the IDF and average document length used by BM25. Each
+    document's terms are kept by point id in a SQLite table, so re-ingesting
+    a document replaces its statistics instead of counting it twice. Rows
+    are written as documents are recorded, so saving only rewrites the
+    per-tenant summary rather than every document's terms.
+    
+    Term ids are assigned in process memory, so the service must run as a
+    single process: separate uvicorn workers would each assign their own
+    ids and overwrite each other's files.
+    """
+    
+    def __init__(self, path: str, cap: int):
+        """
+        Initialize the vocabulary and load persisted state if present.
+        
+        Args:
+            path: Directory holding vocab.json, df.json and documents.db
+            cap: Maximum number of distinct term ids
+        """
+        self.path = path
+        self.cap = cap
+        # Guards term id assignment
+        self._lock = threading.Lock()
+        # Guards the tenant statistics and the documents table
+        self._stats_lock = threading.Lock()
+        # Serializes writers of the shared temporary files
+        self._save_lock = threading.Lock()
+        self._ids: Dict[str, int] = {}
+        self._tenants: Dict[str, Dict] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._ids_dirty = False
+        self._stats_dirty = False
+        self.load()
+    
+    def _tenant_stats(self, tenant_id: str) -> Dict:
+        """Get or create the statistics entry for a tenant."""
+        stats = self._tenants.get(tenant_id)
+        if stats is None:
+            stats = {"doc_count": 0, "total_length": 0, "df": {}}
+            self._tenants[tenant_id] = stats
+        return stats
+    
+    def id_for(self, word: str) -> int:
+        """
+        Get the id for a term, assigning a new one if needed.
+        
+        Once the vocabulary is full, new terms are hashed into the existing
+        id space rather than growing it.
+        
+        Args:
+            word: Normalized term
+        
+        Returns:
+            Integer term id
+        """
+        term_id = self._ids.get(word)
+        if term_id is not None:
+            return term_id
+        
+        with self._lock:
+            term_id = self._ids.get(word)
+            if term_id is not None:
+                return term_id
+            if len(self._ids) < self.cap:
+                term_id = len(self._ids)
+                self._ids[word] = term_id
+                self._ids_dirty = True
+                return term_id
+        
+        return xxhash.xxh3_64_intdigest(word.encode("utf-8")) % self.cap
+    
+    def lookup(self, word: str) -> Optional[int]:
+        """
+        Get the id for a term without assigning a new one.
+        
+        Args:
+            word: Normalized term
+        
+        Returns:
+            Integer term id, or None if the term has never been indexed
+        """
+        term_id = self._ids.get(word)
+        if term_id is None and len(self._ids) >= self.cap:
+            return xxhash.xxh3_64_intdigest(word.encode("utf-8")) % self.cap
+        return term_id
+    
+    def add_document(self, tenant_id: str, point_id: int, term_ids: Iterable[int], length: int):
+        """
+        Record a document's terms in the tenant statistics.
+        
+        Args:
+            tenant_id: Tenant identifier
+            point_id: Deterministic point id of the document
+            term_ids: Distinct term ids in the document
+            length: Number of tokens in the document
+        """
+        self.add_documents([(tenant_id, point_id, term_ids, length)])
+    
+    def add_documents(self, documents: Iterable[Tuple[str, int, Iterable[int], int]]):
+        """
+        Record many documents' terms in the tenant statistics.
+        
+        If a point was recorded before, its previous terms and length are
+        subtracted first, mirroring the upsert that overwrote it. Reads and
+        writes the documents table, so call it from a worker thread.
+        
+        Args:
+            documents: (tenant_id, point_id, term_ids, length) tuples
+        """
+        with self._stats_lock:
+            for tenant_id, point_id, term_ids, length in documents:
+                term_ids = np.fromiter(term_ids, dtype=np.uint32)
+                row_id = _sqlite_id(point_id)
+                previous = self._db.execute(
+                    "SELECT tenant_id, term_ids, length FROM documents WHERE point_id = ?",
+                    (row_id,)
+                ).fetchone()
+                if previous is not None:
+                    self._subtract(previous[0], np.frombuffer(previous[1], dtype=np.uint32), previous[2])
+                
+                stats = self._tenant_stats(tenant_id)
+                df = stats["df"]
+                stats["doc_count"] += 1
+                stats["total_length"] += length
+                for term_id in term_ids.tolist():
+                    df[term_id] = df.get(term_id, 0) + 1
+                self._db.execute(
+                    "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)",
+                    (row_id, tenant_id, term_ids.tobytes(), length)
+                )
+            self._stats_dirty = True
+    
+    def _subtract(self, tenant_id: str, term_ids: np.ndarray, length: int):
+        """Remove a previously recorded document from the tenant statistics."""
+        stats = self._tenants.get(tenant_id)
+        if stats is None:
+            return
+        df = stats["df"]
+        stats["doc_count"] -= 1
+        stats["total_length"] -= length
+        for term_id in term_ids.tolist():
+            count = df.get(term_id, 0) - 1
+            if count > 0:
+                df[term_id] = count
+            else:
+                df.pop(term_id, None)
+    
+    def remove_tenant(self, tenant_id: str):
+        """
+        Drop all statistics for a tenant.
+        
+        Deletes from the documents table, so call it from a worker thread.
+        """
+        with self._stats_lock:
+            self._tenants.pop(tenant_id, None)
+            self._db.execute("DELETE FROM documents WHERE tenant_id = ?", (tenant_id,))
+            self._stats_dirty = True
+    
+    def avgdl(self, tenant_id: str, default: float = 1.0) -> float:
+        """
+        Get the average document length for a tenant.
+        
+        Args:
+            tenant_id: Tenant identifier
+            default: Value returned while the tenant has no documents
+        
+        Returns:
+            Average number of tokens per document
+        """
+        stats = self._tenants.get(tenant_id)
+        if not stats or not stats["doc_count"]:
+            return default
+        return stats["total_length"] / stats["doc_count"]
+    
+    def idf(self, tenant_id: str, term_ids: List[int]) -> np.ndarray:
+        """
+        Compute BM25 inverse document frequencies for a tenant.
+        
+        Args:
+            tenant_id: Tenant identifier
+            term_ids: Term ids to look up
+        
+        Returns:
+            numpy array of IDF weights aligned with term_ids
+        """
+        stats = self._tenants.get(tenant_id)
+        if not stats:
+            return np.zeros(len(term_ids), dtype=np.float32)
+        df_table = stats["df"]
+        n = stats["doc_count"]
+        df = np.fromiter(
+            (df_table.get(term_id, 0) for term_id in term_ids),
+            dtype=np.float32,
+            count=len(term_ids)
+        )
+        return np.log1p((n - df + 0.5) / (df + 0.5))
+    
+    def load(self):
+        """
+        Load the vocabulary and term statistics from disk.
+        
+        Raises:
+            OSError: If a file exists but cannot be read
+            ValueError: If a file is corrupt; starting empty would silently
+                reassign term ids already stored in Qdrant
+        """
+        vocab_file = os.path.join(self.path, "vocab.json")
+        df_file = os.path.join(self.path, "df.json")
+        os.makedirs(self.path, exist_ok=True)
+        try:
+            if os.path.exists(vocab_file):
+                with open(vocab_file, encoding="utf-8") as f:
+                    self._ids = json.load(f)
+            if os.path.exists(df_file):
+                with open(df_file, encoding="utf-8") as f:
+                    tenants = json.load(f)
+                # JSON object keys are strings; term ids are ints
+                for stats in tenants.values():
+                    stats["df"] = {int(k): v for k, v in stats["df"].items()}
+                self._tenants = tenants
+            self._db = self._open_documents_db()
+            # Earlier versions kept each document's terms in df.json
+            for tenant_id, stats in self._tenants.items():
+                documents = stats.pop("documents", None)
+                if documents:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)",
+                        (
+                            (_sqlite_id(int(point_id)), tenant_id,
+                             np.asarray(term_ids, dtype=np.uint32).tobytes(), length)
+                            for point_id, (term_ids, length) in documents.items()
+                        )
+                    )
+                    self._stats_dirty = True
+        except (ValueError, KeyError, TypeError, AttributeError, sqlite3.DatabaseError) as e:
+            raise ValueError(f"Corrupt vocabulary in {self.path}: {e}") from e
+        logger.info(f"Vocabulary loaded with {len(self._ids)} terms")
+    
+    def _open_documents_db(self) -> sqlite3.Connection:
+        """Open the per-document term table, creating it if needed."""
+        db = sqlite3.connect(
+            os.path.join(self.path, "documents.db"),
+            check_same_thread=False
+        )
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "point_id INTEGER PRIMARY KEY, tenant_id TEXT NOT NULL, "
+            "term_ids BLOB NOT NULL, length INTEGER NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS documents_tenant ON documents (tenant_id)")
+        db.commit()
+        return db
+    
+    def save(self):
+        """
+        Persist the vocabulary and term statistics to disk if they changed.
+        
+        Each JSON file is written to a temporary file and renamed into
+        place, so a crash mid-write leaves the previous version intact. The
+        vocabulary is written first, so ids referenced by the statistics
+        always exist. Document rows are committed right after the summary
+        they are counted in; a crash in between can at worst count a
+        re-ingested document twice, never subtract one that was not counted.
+        """
+        with self._save_lock:
+            try:
+                with self._lock:
+                    ids = dict(self._ids) if self._ids_dirty else None
+                    self._ids_dirty = False
+                if ids is not None:
+                    _write_json_atomic(os.path.join(self.path, "vocab.json"), ids)
+                
+                with self._stats_lock:
+                    if not self._stats_dirty:
+                        return
+                    _write_json_atomic(os.path.join(self.path, "df.json"), self._tenants)
+                    self._db.commit()
+                    self._stats_dirty = False
+            except (OSError, sqlite3.Error) as e:
+                if ids is not None:
+                    self._ids_dirty = True
+                logger.error(f"Failed to save vocabulary to {self.path}: {e}")
+                return
+        logger.info(f"Vocabulary saved with {len(self._ids)} terms")
+    
+    def close(self):
+        """Close the documents table, discarding rows recorded since the last save."""
+        with self._stats_lock:
+            self._db.close()
+
+
+# Global instance
+_vocab: Optional[Vocab] = None
+_vocab_lock = threading.Lock()
+
+
+def get_vocab() -> Vocab:
+    """Get or create the global vocabulary instance."""
+    global _vocab
+    if _vocab is None:
+        with _vocab_lock:
+            if _vocab is None:
+                _vocab = Vocab(settings.vocab_path, settings.vocab_cap)
+    return _vocab
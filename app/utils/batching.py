@@ -0,0 +1,165 @@
+"""Coroutine micro-batching for coalescing concurrent requests."""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent submissions into batched handler calls.
+    
+    Items submitted while a batch is being collected (up to max_batch,
+    within max_wait_ms of the first item, or sooner once the batch is
+    full) are passed to the handler together. The handler returns one
+    result per item, in order; an exception instance in place of a result
+    fails only that item.
+    """
+    
+    def __init__(
+        self,
+        handler: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch: int,
+        max_wait_ms: float,
+        name: str = "batcher"
+    ):
+        """
+        Initialize the batcher.
+        
+        Args:
+            handler: Coroutine function processing a list of items
+            max_batch: Maximum number of items per batch
+            max_wait_ms: Time to wait for more items after the first
+            name: Name used in log messages
+        """
+        self.handler = handler
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._batch_full: Optional[asyncio.Event] = None
+        self._stopping = False
+    
+    def start(self):
+        """Start the background flusher on the running event loop."""
+        if self.is_running():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._stopping = False
+        self._queue = asyncio.Queue()
+        self._batch_full = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"{self.name} batcher started (max_batch={self.max_batch}, "
+            f"max_wait_ms={self.max_wait * 1000})"
+        )
+    
+    async def stop(self):
+        """Flush pending items and stop the background flusher."""
+        if self._task is None:
+            return
+        # Later submissions are handled inline rather than queued behind
+        # the sentinel, where nothing would resolve them
+        self._stopping = True
+        await self._queue.put(None)
+        await self._task
+        self._fail_pending()
+        self._task = None
+        self._queue = None
+        self._batch_full = None
+        self._loop = None
+        logger.info(f"{self.name} batcher stopped")
+    
+    def is_running(self) -> bool:
+        """Check if the flusher is accepting items on the current event loop."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        return (
+            self._task is not None
+            and not self._task.done()
+            and not self._stopping
+            and self._loop is loop
+        )
+    
+    async def submit(self, item: Any) -> Any:
+        """
+        Queue an item and wait for its result.
+        
+        Falls back to handling the item on its own when the flusher is not
+        running (e.g. the app is used without its lifespan).
+        
+        Args:
+            item: Item to process
+        
+        Returns:
+            The handler's result for this item
+        """
+        if not self.is_running():
+            result = (await self.handler([item]))[0]
+            if isinstance(result, Exception):
+                raise result
+            return result
+        
+        future = self._loop.create_future()
+        await self._queue.put((item, future))
+        # The flusher holds the first item of a batch outside the queue
+        if self._queue.qsize() >= self.max_batch - 1:
+            self._batch_full.set()
+        return await future
+    
+    async def _run(self):
+        """Collect queued items into batches and process them."""
+        stopping = False
+        while not stopping:
+            entry = await self._queue.get()
+            if entry is None:
+                break
+            batch = [entry]
+            
+            # Give concurrent requests a short window to join the batch,
+            # flushing early once it is full
+            if len(batch) < self.max_batch and self._queue.empty():
+                try:
+                    async with asyncio.timeout(self.max_wait):
+                        await self._batch_full.wait()
+                except TimeoutError:
+                    pass
+            self._batch_full.clear()
+            while len(batch) < self.max_batch and not self._queue.empty():
+                entry = self._queue.get_nowait()
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+            
+            await self._process(batch)
+    
+    def _fail_pending(self):
+        """Fail any futures still queued once the flusher has exited."""
+        while not self._queue.empty():
+            entry = self._queue.get_nowait()
+            if entry is not None and not entry[1].done():
+                entry[1].set_exception(RuntimeError(f"{self.name} batcher stopped"))
+    
+    async def _process(self, batch: List[Tuple[Any, asyncio.Future]]):
+        """Process a batch and resolve the waiting futures."""
+        try:
+            results = await self.handler([item for item, _ in batch])
+        except Exception as e:
+            logger.error(f"{self.name} batch of {len(batch)} items failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
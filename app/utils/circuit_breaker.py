@@ -1,7 +1,8 @@
 """Circuit breaker pattern for LLM calls with timeout handling."""
 import asyncio
 import logging
-from typing import Callable, TypeVar, Any
+import math
+from typing import Callable, TypeVar, Any, Optional
 from functools import wraps
 
 logger = logging.getLogger(__name__)
@@ -14,12 +15,18 @@ class CircuitBreakerException(Exception):
     pass
 
 
-def circuit_breaker(timeout: float):
+def _unbounded(timeout: Optional[float]) -> bool:
+    """Check whether a timeout disables the time limit."""
+    return timeout is None or timeout == math.inf
+
+
+def circuit_breaker(timeout: Optional[float]):
     """
     Decorator that implements a simple circuit breaker with timeout.
     
     Args:
-        timeout: Maximum time to wait for the function to complete
+        timeout: Maximum time to wait for the function to complete;
+            None or math.inf disables the timeout
         
     Raises:
         CircuitBreakerException: If the function times out
@@ -27,41 +34,48 @@ def circuit_breaker(timeout: float):
     def decorator(func: Callable) -> Callable:
         @wraps(func)
         async def wrapper(*args, **kwargs):
+            if _unbounded(timeout):
+                return await func(*args, **kwargs)
             try:
-                return await asyncio.wait_for(
-                    func(*args, **kwargs),
-                    timeout=timeout
+                # A timeout scope cancels the call in place, without wrapping
+                # it in a task the way wait_for does
+                async with asyncio.timeout(timeout):
+                    return await func(*args, **kwargs)
+            except TimeoutError:
+                logger.warning(
+                    "Circuit breaker triggered: %s timed out after %ss", func.__name__, timeout
                 )
-            except asyncio.TimeoutError:
-                logger.warning(f"Circuit breaker triggered: {func.__name__} timed out after {timeout}s")
                 raise CircuitBreakerException(
                     f"Operation timed out after {timeout} seconds"
                 )
             except Exception as e:
-                logger.error(f"Circuit breaker caught exception in {func.__name__}: {e}")
+                logger.error("Circuit breaker caught exception in %s: %s", func.__name__, e)
                 raise
         
         return wrapper
     return decorator
 
 
-async def with_timeout(coro, timeout: float, default: Any = None):
+async def with_timeout(coro, timeout: Optional[float], default: Any = None):
     """
     Execute a coroutine with timeout and return default value on timeout.
     
     Args:
         coro: Coroutine to execute
-        timeout: Maximum time to wait
+        timeout: Maximum time to wait; None or math.inf disables the timeout
         default: Default value to return on timeout
         
     Returns:
         Result of coroutine or default value on timeout
     """
+    if _unbounded(timeout):
+        return await coro
     try:
-        return await asyncio.wait_for(coro, timeout=timeout)
-    except asyncio.TimeoutError:
-        logger.warning(f"Operation timed out after {timeout}s, returning default value")
+        async with asyncio.timeout(timeout):
+            return await coro
+    except TimeoutError:
+        logger.warning("Operation timed out after %ss, returning default value", timeout)
         return default
     except Exception as e:
-        logger.error(f"Error in with_timeout: {e}")
+        logger.error("Error in with_timeout: %s", e)
         raise
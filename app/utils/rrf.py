@@ -1,10 +1,52 @@
 """Reciprocal Rank Fusion implementation for merging ranked lists."""
-from typing import List, Dict, Any
+import heapq
+from functools import lru_cache
+from operator import itemgetter
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+
+
+@lru_cache(maxsize=64)
+def _rank_weights(k: int, length: int) -> Tuple[float, ...]:
+    """Return the RRF contributions 1 / (k + rank) for ranks 1..length."""
+    return tuple((1.0 / (k + np.arange(1, length + 1))).tolist())
+
+
+def _rank_single_list(
+    results: List[Dict[str, Any]],
+    rank_scores: Tuple[float, ...],
+    limit: Optional[int]
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Score a lone ranked list without fusing it.
+    
+    Its order is already final and only the scores change, so there is
+    nothing to accumulate or sort. Returns None when a document repeats,
+    which needs the full fusion.
+    """
+    ranked = [
+        (rrf_score, result)
+        for rrf_score, result in zip(rank_scores, results)
+        if result.get("document_id")
+    ]
+    if len({result["document_id"] for _, result in ranked}) != len(ranked):
+        return None
+    
+    return [
+        {
+            "document_id": result["document_id"],
+            "content": result.get("content", ""),
+            "metadata": result.get("metadata", {}),
+            "score": rrf_score
+        }
+        for rrf_score, result in ranked[:limit]
+    ]
 
 
 def reciprocal_rank_fusion(
     results_list: List[List[Dict[str, Any]]],
-    k: int = 60
+    k: int = 60,
+    limit: Optional[int] = None
 ) -> List[Dict[str, Any]]:
     """
     Merge multiple ranked lists using Reciprocal Rank Fusion (RRF).
@@ -14,48 +56,55 @@ def reciprocal_rank_fusion(
     Args:
         results_list: List of ranked result lists to merge
         k: Constant for RRF formula (default: 60)
+        limit: Maximum number of results to return (default: all)
         
     Returns:
         Merged and re-ranked list of results
     """
-    # Dictionary to accumulate RRF scores
-    doc_scores: Dict[str, float] = {}
-    doc_data: Dict[str, Dict[str, Any]] = {}
+    # Empty lists contribute nothing, e.g. a search that timed out
+    results_list = [results for results in results_list if results]
+    if not results_list:
+        return []
+    
+    # RRF score contribution for every rank; lists are bounded by top_k, so
+    # the table is almost always reused from an earlier call
+    max_len = max(len(results) for results in results_list)
+    rank_scores = _rank_weights(k, max_len)
+    
+    if len(results_list) == 1:
+        merged_results = _rank_single_list(results_list[0], rank_scores, limit)
+        if merged_results is not None:
+            return merged_results
+    
+    # Accumulated RRF score and first occurrence of each document, kept in
+    # one mutable entry so repeat hits cost a single dict probe
+    entries: Dict[str, List[Any]] = {}
     
     # Process each result list
     for results in results_list:
-        for rank, result in enumerate(results, start=1):
+        for rrf_score, result in zip(rank_scores, results):
             doc_id = result.get("document_id")
             if not doc_id:
                 continue
-            
-            # Calculate RRF score contribution
-            rrf_score = 1.0 / (k + rank)
-            
-            # Accumulate score
-            if doc_id in doc_scores:
-                doc_scores[doc_id] += rrf_score
+            entry = entries.get(doc_id)
+            if entry is None:
+                entries[doc_id] = [rrf_score, doc_id, result]
             else:
-                doc_scores[doc_id] = rrf_score
-                # Store document data from first occurrence
-                doc_data[doc_id] = {
-                    "document_id": doc_id,
-                    "content": result.get("content", ""),
-                    "metadata": result.get("metadata", {})
-                }
-    
-    # Sort by RRF score (descending)
-    sorted_docs = sorted(
-        doc_scores.items(),
-        key=lambda x: x[1],
-        reverse=True
-    )
-    
-    # Build final result list with RRF scores
-    merged_results = []
-    for doc_id, score in sorted_docs:
-        result = doc_data[doc_id].copy()
-        result["score"] = score
-        merged_results.append(result)
-    
-    return merged_results
+                entry[0] += rrf_score
+    
+    # Sort by RRF score (descending); a bounded heap suffices for top-k
+    if limit is None:
+        ranked = sorted(entries.values(), key=itemgetter(0), reverse=True)
+    else:
+        ranked = heapq.nlargest(limit, entries.values(), key=itemgetter(0))
+    
+    # Build final result list with RRF scores, only for the selected entries
+    return [
+        {
+            "document_id": doc_id,
+            "content": result.get("content", ""),
+            "metadata": result.get("metadata", {}),
+            "score": score
+        }
+        for score, doc_id, result in ranked
+    ]
@@ -1,6 +1,11 @@
 """Tests for search and RRF functionality."""
+import asyncio
+
+import numpy as np
 import pytest
+from app.utils.batching import MicroBatcher
 from app.utils.rrf import reciprocal_rank_fusion
+from app.services.vocab import Vocab
 
 
 def test_rrf_basic():
@@ -52,6 +57,19 @@ def test_rrf_single_list():
     assert merged[1]["document_id"] == "doc2"
 
 
+def test_rrf_limit():
+    """Test RRF returns only the top results when limited."""
+    list1 = [
+        {"document_id": f"doc{i}", "content": f"content{i}", "score": 1.0 - i / 10}
+        for i in range(6)
+    ]
+    
+    merged = reciprocal_rank_fusion([list1, list1[::-1][:2]], k=60, limit=3)
+    full = reciprocal_rank_fusion([list1, list1[::-1][:2]], k=60)
+    
+    assert [doc["document_id"] for doc in merged] == [doc["document_id"] for doc in full[:3]]
+
+
 def test_rrf_no_overlap():
     """Test RRF with no overlapping documents."""
     list1 = [
@@ -96,6 +114,102 @@ def test_rrf_score_calculation():
     assert abs(merged[0]["score"] - expected_score) < 0.0001
 
 
+def test_vocab_idf(tmp_path):
+    """Test that rarer terms get a higher BM25 IDF weight."""
+    vocab = Vocab(str(tmp_path), cap=100)
+    common = vocab.id_for("python")
+    rare = vocab.id_for("fastapi")
+    
+    vocab.add_document("tenant", 1, {common, rare}, length=2)
+    vocab.add_document("tenant", 2, {common}, length=4)
+    
+    idf = vocab.idf("tenant", [common, rare])
+    assert idf[1] > idf[0] > 0
+    assert vocab.avgdl("tenant") == 3.0
+    
+    # Statistics are isolated per tenant
+    assert vocab.idf("other_tenant", [common]).tolist() == [0.0]
+
+
+def test_vocab_overwrite(tmp_path):
+    """Test that re-adding a point replaces its statistics."""
+    vocab = Vocab(str(tmp_path), cap=100)
+    common = vocab.id_for("python")
+    rare = vocab.id_for("fastapi")
+    
+    vocab.add_document("tenant", 1, {common}, length=2)
+    vocab.add_document("tenant", 2, {common}, length=2)
+    before = vocab.idf("tenant", [common, rare])
+    
+    vocab.add_document("tenant", 1, {common, rare}, length=6)
+    vocab.add_document("tenant", 1, {common}, length=2)
+    
+    assert vocab.idf("tenant", [common, rare]).tolist() == before.tolist()
+    assert vocab.avgdl("tenant") == 2.0
+
+
+def test_vocab_persistence(tmp_path):
+    """Test that term ids and statistics survive a save/load cycle."""
+    vocab = Vocab(str(tmp_path), cap=100)
+    term_id = vocab.id_for("qdrant")
+    vocab.add_document("tenant", 1, {term_id}, length=1)
+    vocab.save()
+    
+    reloaded = Vocab(str(tmp_path), cap=100)
+    assert reloaded.lookup("qdrant") == term_id
+    assert reloaded.lookup("unknown") is None
+    assert reloaded.avgdl("tenant") == 1.0
+    
+    # Overwrites are still detected after a reload
+    reloaded.add_document("tenant", 1, {term_id}, length=3)
+    assert reloaded.avgdl("tenant") == 3.0
+
+
+def test_vocab_unsaved_documents(tmp_path):
+    """Test that documents recorded after the last save are not persisted without it."""
+    vocab = Vocab(str(tmp_path), cap=100)
+    term_id = vocab.id_for("qdrant")
+    vocab.add_document("tenant", 1, {term_id}, length=2)
+    vocab.save()
+    vocab.add_document("tenant", 2, {term_id}, length=4)
+    vocab.close()
+    
+    # Summary and document rows stay consistent, as after a crash
+    reloaded = Vocab(str(tmp_path), cap=100)
+    assert reloaded.avgdl("tenant") == 2.0
+    reloaded.add_document("tenant", 2, {term_id}, length=6)
+    assert reloaded.avgdl("tenant") == 4.0
+
+
+def test_sparse_vector_first_document(tmp_path):
+    """Test that a tenant's first document is weighted like later ones of average length."""
+    from app.services.qdrant_client import QdrantService
+    
+    qdrant = QdrantService.__new__(QdrantService)
+    qdrant.vocab = Vocab(str(tmp_path), cap=100)
+    text = "python " + " ".join(f"term{i}" for i in range(49))
+    
+    first, length = qdrant._create_sparse_vector("tenant", text)
+    qdrant.vocab.add_document("tenant", 1, first.indices, length)
+    later, _ = qdrant._create_sparse_vector("tenant", text)
+    
+    assert first.indices == later.indices
+    assert first.values == pytest.approx(later.values)
+    assert first.values[0] == pytest.approx(1.0)
+
+
+def test_vocab_corrupt_file(tmp_path):
+    """Test that a corrupt vocabulary file fails loading instead of starting empty."""
+    vocab = Vocab(str(tmp_path), cap=100)
+    vocab.id_for("qdrant")
+    vocab.save()
+    assert not list(tmp_path.glob("*.tmp"))
+    
+    (tmp_path / "vocab.json").write_text('{"qdrant": 0', encoding="utf-8")
+    with pytest.raises(ValueError):
+        Vocab(str(tmp_path), cap=100)
+
+
 @pytest.mark.asyncio
 async def test_embedding_generation():
     """Test embedding generation."""
@@ -119,6 +233,27 @@ async def test_embedding_generation():
     assert len(embeddings[0]) == embedder.get_dimension()
 
 
+def test_embedding_cache():
+    """Test that repeated content is served from the embedding cache."""
+    from app.services.embedding import get_embedding_service
+    
+    embedder = get_embedding_service()
+    
+    text = "Cached embedding test sentence."
+    first = embedder.encode(text)
+    second = embedder.encode(text)
+    
+    # Same cached array is returned and protected from mutation
+    assert first is second
+    assert not first.flags.writeable
+    
+    # Batch encoding reuses cached vectors and preserves order
+    embeddings = embedder.encode_batch([text, "Another sentence.", text])
+    assert len(embeddings) == 3
+    assert (embeddings[0] == first).all()
+    assert (embeddings[2] == first).all()
+
+
 @pytest.mark.asyncio
 async def test_hybrid_search():
     """Test hybrid search functionality."""
@@ -141,7 +276,7 @@ async def test_hybrid_search():
     ]
     
     for doc in test_docs:
-        vector = embedder.encode(doc["content"]).tolist()
+        vector = embedder.encode(doc["content"])
         await qdrant.insert_document(
             tenant_id=tenant_id,
             document_id=doc["id"],
@@ -164,3 +299,184 @@ async def test_hybrid_search():
     # Results should contain relevant documents
     doc_ids = [r["document_id"] for r in results]
     assert any(doc_id in doc_ids for doc_id in ["h_doc1", "h_doc2", "h_doc3"])
+
+
+class _StubEmbedder:
+    """Embedder with no cached queries and an instant encode."""
+    
+    def get_cached(self, text):
+        return None
+    
+    async def encode_async(self, text):
+        return np.zeros(4, dtype=np.float32)
+
+
+class _StubQdrant:
+    """Qdrant service whose dense or sparse search can be made to hang."""
+    
+    def __init__(self, dense_hangs: bool, sparse_hangs: bool):
+        self.dense_hangs = dense_hangs
+        self.sparse_hangs = sparse_hangs
+    
+    async def search_dense(self, tenant_id, query_vector, top_k):
+        if self.dense_hangs:
+            await asyncio.sleep(10)
+        return [{"document_id": "dense_doc", "content": "dense", "score": 0.9}]
+    
+    async def search_sparse(self, tenant_id, query_text, top_k):
+        if self.sparse_hangs:
+            await asyncio.sleep(10)
+        return [{"document_id": "sparse_doc", "content": "sparse", "score": 0.9}]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("dense_hangs, sparse_hangs, expected", [
+    (False, True, ["dense_doc"]),
+    (True, False, ["sparse_doc"]),
+    (True, True, []),
+])
+async def test_hybrid_search_partial_timeout(dense_hangs, sparse_hangs, expected):
+    """Test that hybrid search returns whichever results finished before the timeout."""
+    from app.services.search import SearchService
+    
+    search_service = SearchService.__new__(SearchService)
+    search_service.qdrant = _StubQdrant(dense_hangs, sparse_hangs)
+    search_service.embedder = _StubEmbedder()
+    search_service._rrf_k = 60
+    search_service._timeout = 0.05
+    
+    results, latency_ms = await search_service.hybrid_search("tenant", "query", top_k=5)
+    
+    assert [r["document_id"] for r in results] == expected
+    assert latency_ms < 1000
+
+
+async def _double(items):
+    """Batch handler doubling each item."""
+    await asyncio.sleep(0.01)
+    return [item * 2 for item in items]
+
+
+@pytest.mark.asyncio
+async def test_micro_batcher_flushes_full_batch():
+    """Test that a full batch is handled without waiting out max_wait_ms."""
+    batches = []
+    
+    async def handler(items):
+        batches.append(list(items))
+        return items
+    
+    batcher = MicroBatcher(handler, max_batch=3, max_wait_ms=5000)
+    batcher.start()
+    try:
+        async with asyncio.timeout(1):
+            assert await asyncio.gather(*[batcher.submit(i) for i in range(3)]) == [0, 1, 2]
+            # A batch that is full on its first item skips the window too
+            single = MicroBatcher(handler, max_batch=1, max_wait_ms=5000)
+            single.start()
+            assert await single.submit(3) == 3
+            await single.stop()
+    finally:
+        await batcher.stop()
+    
+    assert batches == [[0, 1, 2], [3]]
+
+
+@pytest.mark.asyncio
+async def test_micro_batcher_item_error():
+    """Test that an exception returned for one item fails only that item."""
+    async def handler(items):
+        return [ValueError(item) if item == "bad" else item.upper() for item in items]
+    
+    batcher = MicroBatcher(handler, max_batch=8, max_wait_ms=5)
+    batcher.start()
+    results = await asyncio.gather(
+        batcher.submit("a"), batcher.submit("bad"), batcher.submit("b"),
+        return_exceptions=True
+    )
+    await batcher.stop()
+    
+    assert results[0] == "A" and results[2] == "B"
+    assert isinstance(results[1], ValueError)
+
+
+@pytest.mark.asyncio
+async def test_micro_batcher_inline_without_start():
+    """Test that submit handles the item inline when the batcher is not started."""
+    batcher = MicroBatcher(_double, max_batch=8, max_wait_ms=5000)
+    
+    assert not batcher.is_running()
+    assert await batcher.submit(21) == 42
+
+
+@pytest.mark.asyncio
+async def test_micro_batcher_stop_drains_pending():
+    """Test that stop() handles items that were queued before it."""
+    batcher = MicroBatcher(_double, max_batch=2, max_wait_ms=50)
+    batcher.start()
+    
+    pending = [asyncio.create_task(batcher.submit(i)) for i in range(5)]
+    await asyncio.sleep(0)
+    await batcher.stop()
+    
+    assert all(task.done() for task in pending)
+    assert [task.result() for task in pending] == [0, 2, 4, 6, 8]
+
+
+@pytest.mark.asyncio
+async def test_micro_batcher_submit_during_stop():
+    """Test that an item submitted while the batcher stops is still handled."""
+    batcher = MicroBatcher(_double, max_batch=4, max_wait_ms=5)
+    batcher.start()
+    
+    first = asyncio.create_task(batcher.submit(1))
+    await asyncio.sleep(0)
+    stop = asyncio.create_task(batcher.stop())
+    await asyncio.sleep(0)
+    late = asyncio.create_task(batcher.submit(2))
+    
+    async with asyncio.timeout(1):
+        assert await asyncio.gather(first, late, stop) == [2, 4, None]
+
+
+class _StubIngestQdrant:
+    """Qdrant service that rejects one document and records upserted points."""
+    
+    def __init__(self):
+        self.upserted = []
+    
+    def build_point(self, tenant_id, document_id, content, metadata, dense_vector):
+        if document_id == "bad":
+            raise ValueError("Value out of range")
+        return document_id
+    
+    async def insert_documents_bulk(self, points):
+        self.upserted.extend(points)
+
+
+class _StubBatchEmbedder:
+    """Embedder returning zero vectors for a batch."""
+    
+    async def encode_batch_async(self, texts):
+        return np.zeros((len(texts), 4), dtype=np.float32)
+
+
+@pytest.mark.asyncio
+async def test_ingest_batch_isolates_failures(monkeypatch):
+    """Test that a document whose point cannot be built fails alone."""
+    from app.models import DocumentInput
+    from app.services import ingest_batcher
+    
+    qdrant = _StubIngestQdrant()
+    monkeypatch.setattr(ingest_batcher, "get_qdrant_service", lambda: qdrant)
+    monkeypatch.setattr(ingest_batcher, "get_embedding_service", _StubBatchEmbedder)
+    
+    documents = [
+        DocumentInput(tenant_id="tenant", document_id=document_id, content="text", metadata={})
+        for document_id in ["good1", "bad", "good2"]
+    ]
+    results = await ingest_batcher.IngestBatcher()._flush(documents)
+    
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], ValueError)
+    assert qdrant.upserted == ["good1", "good2"]